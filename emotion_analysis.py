@@ -1,69 +1,227 @@
-import cv2
-from deepface import DeepFace
-
-
-class EmotionAnalyzer:
-    def __init__(self, backend: str = "opencv"):
-        """
-        Initialize the emotion analyzer.
-
-        Args:
-            backend: DeepFace backend (opencv, retinaface, mtcnn, ssd, dlib ...)
-        """
-        self.backend = backend
-
-    def analyze(self, frame):
-        """
-        Analyze emotion from a webcam frame.
-
-        Args:
-            frame: BGR numpy array image from webcam
-
-        Returns:
-            dict or None:
-                {
-                    "emotion": "happy",
-                    "confidence": 0.92,
-                    "raw": <DeepFace output>
-                }
-        """
-        if frame is None:
-            return None
-
-        try:
-            # Convert BGR → RGB for DeepFace
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            result = DeepFace.analyze(
-                rgb,
-                actions=["emotion"],
-                detector_backend=self.backend,
-                enforce_detection=False
-            )
-
-            # DeepFace ALWAYS returns a list → extract first item
-            if isinstance(result, list):
-                result = result[0]
-
-            if "dominant_emotion" not in result:
-                return None
-
-            dominant = result["dominant_emotion"].lower()
-
-            # Extract confidence score
-            emotion_scores = result.get("emotion", {})
-            confidence = (
-                emotion_scores.get(dominant.capitalize())
-                or emotion_scores.get(dominant)
-                or 0
-            )
-
-            return {
-                "emotion": dominant,
-                "confidence": float(confidence),
-                "raw": result
-            }
-
-        except Exception as e:
-            print(f"[EmotionAnalyzer] Failed: {e}")
-            return None
+import os
+import threading
+
+# Enable XLA auto-clustering — must be set before TensorFlow is imported
+os.environ.setdefault("TF_XLA_FLAGS", "--tf_xla_auto_jit=2")
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from deepface import DeepFace
+
+# ONNX Runtime is optional — used when an exported model is present,
+# roughly 3x faster on CPU and ~10x on GPU vs the TF/Keras wrapper
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+class EmotionAnalyzer:
+
+    # Output order of the DeepFace emotion model
+    EMOTION_LABELS = ["angry", "disgust", "fear",
+                      "happy", "sad", "surprise", "neutral"]
+
+    # Detection width — detector cost scales with frame area, and the
+    # emotion model only sees a 48x48 crop anyway. Height follows the
+    # frame's own aspect ratio (cameras don't all deliver 4:3)
+    ANALYZE_WIDTH = 320
+
+    # Exported ONNX models (see export_onnx) — loaded when present
+    ONNX_PATH = "emotion.onnx"
+    ONNX_INT8_PATH = "emotion_int8.onnx"
+
+    def __init__(self, backend: str = "opencv"):
+        """
+        Initialize the emotion analyzer.
+
+        Construction is cheap — the heavy model build lives in warm_up(),
+        which the GUI kicks off on a background thread while Qt starts.
+        analyze() warms up on demand, so standalone use still works.
+
+        Args:
+            backend: DeepFace backend (kept for compatibility — detection on
+                the hot path uses the Haar cascade below)
+        """
+        self.backend = backend
+        self._last_scale = 1.0  # frame→analysis scale, for de-projection
+
+        self.model = None
+        self.session = None
+        self._warm_lock = threading.Lock()
+        self._warm = False
+
+        # Cheap Haar face detector for the hot path — C++/SIMD, ~1ms on a
+        # 320-wide grayscale frame. No face found → the CNN never runs.
+        # detectMultiScale is stateful, so each thread gets its own
+        # instance (the vote runs analyze() on several threads at once)
+        self._haar_path = (cv2.data.haarcascades
+                           + "haarcascade_frontalface_default.xml")
+        self._tls = threading.local()
+
+    def _get_haar(self):
+        """Per-thread Haar cascade — a shared instance is not thread-safe."""
+        haar = getattr(self._tls, "haar", None)
+        if haar is None:
+            haar = cv2.CascadeClassifier(self._haar_path)
+            self._tls.haar = haar
+        return haar
+
+    def warm_up(self):
+        """Build the emotion model. Idempotent and thread-safe — run it on
+        a daemon thread at startup so the first analyze() call is warm
+        instead of paying the ~5s cold start."""
+        with self._warm_lock:
+            if self._warm:
+                return
+
+            # Prefer an exported ONNX model when one is available; fall
+            # back to the Keras model cached inside DeepFace
+            onnx_path = self._pick_onnx_model() if ort is not None else None
+            if onnx_path:
+                self.session = ort.InferenceSession(
+                    onnx_path, providers=ort.get_available_providers())
+                self._input_name = self.session.get_inputs()[0].name
+                print(f"[EmotionAnalyzer] Using ONNX model ({onnx_path})")
+            else:
+                # On GPU, run the model in FP16 — tensor cores on Volta+
+                # cards make half precision ~3x faster. CPU stays FP32
+                if tf.config.list_physical_devices("GPU"):
+                    tf.keras.mixed_precision.set_global_policy(
+                        "mixed_float16")
+
+                # Build + cache the emotion model (newer DeepFace wraps the
+                # Keras network in a client object → unwrap it)
+                built = DeepFace.build_model("Emotion")
+                self.model = getattr(built, "model", built)
+
+                # JIT-compile the forward pass with XLA (fuses elementwise
+                # + matmul ops — roughly halves inference latency), warmed
+                # with a dummy tensor so the first frame isn't billed for
+                # compilation
+                self._predict_fn = tf.function(
+                    lambda x: self.model(x, training=False),
+                    jit_compile=True)
+                self._predict_fn(tf.zeros((1, 48, 48, 1)))
+
+            self._warm = True
+
+    def _pick_onnx_model(self):
+        """Choose the exported model to load, or None if none exists.
+        CPU-only machines prefer the INT8 model — modern x86 runs int8 dot
+        products (VNNI) 2-3x faster than FP32."""
+        # Check for the absence of GPU providers — CPU builds report extra
+        # entries (e.g. AzureExecutionProvider), so don't match the exact list
+        gpu_providers = {"CUDAExecutionProvider", "TensorrtExecutionProvider"}
+        cpu_only = not (gpu_providers & set(ort.get_available_providers()))
+        if cpu_only and os.path.exists(self.ONNX_INT8_PATH):
+            return self.ONNX_INT8_PATH
+        if os.path.exists(self.ONNX_PATH):
+            return self.ONNX_PATH
+        return None
+
+    def _predict(self, x):
+        """Run the 1x48x48x1 float32 tensor through whichever backend loaded."""
+        if self.session is not None:
+            out = self.session.run(None, {self._input_name: x})[0]
+        else:
+            out = self._predict_fn(x).numpy()
+        return np.asarray(out).flatten()
+
+    @classmethod
+    def export_onnx(cls, path: str = None):
+        """
+        One-time export of the DeepFace emotion model to ONNX.
+
+        Run once (e.g. `python -c "from emotion_analysis import
+        EmotionAnalyzer; EmotionAnalyzer.export_onnx()"`); afterwards the
+        analyzer picks up the .onnx file automatically at startup.
+        """
+        import tf2onnx
+
+        path = path or cls.ONNX_PATH
+        built = DeepFace.build_model("Emotion")
+        model = getattr(built, "model", built)
+        tf2onnx.convert.from_keras(model, output_path=path)
+        print(f"[EmotionAnalyzer] Exported ONNX model → {path}")
+
+        # Also emit an INT8-quantized copy for CPU deployment (4x smaller
+        # weights, VNNI int8 kernels where the CPU has them)
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(path, cls.ONNX_INT8_PATH,
+                             weight_type=QuantType.QUInt8)
+            print(f"[EmotionAnalyzer] Quantized → {cls.ONNX_INT8_PATH}")
+        except ImportError:
+            print("[EmotionAnalyzer] onnxruntime not installed → "
+                  "skipping INT8 quantization")
+        return path
+
+    def analyze(self, frame):
+        """
+        Analyze emotion from a webcam frame.
+
+        Args:
+            frame: BGR numpy array image from webcam
+
+        Returns:
+            dict or None:
+                {
+                    "emotion": "happy",
+                    "confidence": 0.92,
+                    "raw": {emotion: score, ...}
+                }
+        """
+        if frame is None:
+            return None
+
+        try:
+            # No-op once warm; a click that beats the warm-boot thread
+            # simply blocks here until the model is ready. Inside the try
+            # so a failed build (weight download, bad .onnx) degrades to
+            # a None result instead of killing the caller's thread
+            self.warm_up()
+            # No BGR→RGB pass needed — the opencv detector takes BGR as-is,
+            # and the emotion model only sees grayscale anyway
+            # Downscale before detection — same 48x48 crop out, far less
+            # detector work in
+            self._last_scale = frame.shape[1] / self.ANALYZE_WIDTH
+            small = cv2.resize(
+                frame,
+                (self.ANALYZE_WIDTH,
+                 int(round(frame.shape[0] / self._last_scale))),
+                interpolation=cv2.INTER_AREA)
+
+            # Haar pre-filter: bail out before the CNN when no face is there
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            boxes = self._get_haar().detectMultiScale(
+                gray, scaleFactor=1.2, minNeighbors=4, minSize=(60, 60))
+            if len(boxes) == 0:
+                return None
+
+            # Largest face wins; pad a little so chin/forehead stay in
+            x, y, w, h = max(boxes, key=lambda b: b[2] * b[3])
+            m = w // 5
+            crop = gray[max(0, y - m):y + h + m, max(0, x - m):x + w + m]
+            face48 = cv2.resize(crop, (48, 48))
+
+            # Run the cached model directly — skips the per-call model lookup
+            # and JSON assembly inside DeepFace.analyze
+            # The model is trained on [0,1] inputs — raw 0-255 floats
+            # saturate the conv layers and garbage the prediction
+            x = face48.astype(np.float32)[None, :, :, None] / 255.0
+            scores = self._predict(x)
+
+            idx = int(scores.argmax())
+            total = float(scores.sum()) or 1.0
+
+            return {
+                "emotion": self.EMOTION_LABELS[idx],
+                "confidence": float(scores[idx]) / total * 100,
+                "raw": dict(zip(self.EMOTION_LABELS, scores.tolist()))
+            }
+
+        except Exception as e:
+            print(f"[EmotionAnalyzer] Failed: {e}")
+            return None
@@ -1,196 +1,343 @@
-# interface.py — Aura Emotion Engine GUI with Aura effect
-import sys
-import time
-from collections import Counter
-from PySide6.QtWidgets import QApplication, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QWidget
-from PySide6.QtGui import QPixmap, QImage
-from PySide6.QtCore import QTimer
-import cv2
-
-from webcam_manager import WebcamManager
-from emotion_analysis import EmotionAnalyzer
-from spotify_player import SpotifyPlayer
-
-# ---------------------------
-# CONFIG
-# ---------------------------
-CLIENT_ID = "ba3712c147094d3e8291abe866ceae2b"
-CLIENT_SECRET = "9f2c96ee53c6439da9b4b7491cd4c84d"
-REDIRECT_URI = "http://127.0.0.1:8888/callback"
-
-EMOTION_FRAMES = 5
-EMOTION_DELAY = 0.5  # seconds between frames
-
-# ---------------------------
-# GLOBAL STATE
-# ---------------------------
-wm = WebcamManager()
-ea = EmotionAnalyzer()
-spotify = SpotifyPlayer(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
-
-current_emotion = "None"
-current_track = "None"
-
-# ---------------------------
-# HELPER FUNCTIONS
-# ---------------------------
-
-
-def detect_dominant_emotion():
-    """Capture multiple frames and return the most frequent emotion."""
-    emotions = []
-    for _ in range(EMOTION_FRAMES):
-        ok, frame = wm.get_frame()
-        if not ok:
-            continue
-        data = ea.analyze(frame)
-        if data:
-            emotions.append(data["emotion"])
-        time.sleep(EMOTION_DELAY)
-    if emotions:
-        return Counter(emotions).most_common(1)[0][0]
-    return None
-
-
-def update_track_info():
-    """Update current track info from Spotify."""
-    global current_track
-    try:
-        current = spotify.sp.current_playback()
-        if current and current.get("item"):
-            track_name = current["item"]["name"]
-            artist_name = ", ".join([a["name"]
-                                    for a in current["item"]["artists"]])
-            current_track = f"{track_name} - {artist_name}"
-        else:
-            current_track = "No track playing"
-    except:
-        current_track = "Error getting track info"
-
-# ---------------------------
-# GUI CLASS
-# ---------------------------
-
-
-class AuraInterface(QWidget):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Aura Emotion Engine")
-        self.resize(700, 600)
-
-        # Widgets
-        self.label_video = QLabel(self)
-        self.label_emotion = QLabel("Emotion: None", self)
-        self.label_track = QLabel("Track: None", self)
-
-        self.btn_play_pause = QPushButton("Play / Pause", self)
-        self.btn_prev = QPushButton("Previous", self)
-        self.btn_next = QPushButton("Next (Emotion)", self)
-
-        # Layouts
-        button_layout = QHBoxLayout()
-        button_layout.addWidget(self.btn_prev)
-        button_layout.addWidget(self.btn_play_pause)
-        button_layout.addWidget(self.btn_next)
-
-        layout = QVBoxLayout()
-        layout.addWidget(self.label_video)
-        layout.addWidget(self.label_emotion)
-        layout.addWidget(self.label_track)
-        layout.addLayout(button_layout)
-        self.setLayout(layout)
-
-        # Signals
-        self.btn_play_pause.clicked.connect(self.toggle_play_pause)
-        self.btn_prev.clicked.connect(self.previous_track)
-        self.btn_next.clicked.connect(self.next_track_emotion)
-
-        # Timers
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # ~30 FPS
-
-        self.track_timer = QTimer()
-        self.track_timer.timeout.connect(self.update_track_label)
-        self.track_timer.start(5000)  # Update every 5 sec
-
-    # ---------------------------
-    # Webcam feed with Aura overlay
-    def update_frame(self):
-        ok, frame = wm.get_frame()
-        if ok:
-            # Determine aura color based on current emotion
-            color_map = {
-                "happy": (0, 255, 255),       # yellow/cyan-ish
-                "sad": (255, 0, 0),           # blue
-                "angry": (0, 0, 255),         # red
-                "surprise": (0, 255, 255),    # white/yellow
-                "neutral": (128, 128, 128),   # gray
-            }
-            # default dark gray
-            color = color_map.get(current_emotion, (50, 50, 50))
-
-            # Create aura overlay
-            overlay = frame.copy()
-            alpha = 0.25  # transparency
-            overlay[:] = color
-            cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-
-            # Convert to QImage and display
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb.shape
-            bytes_per_line = ch * w
-            qimg = QImage(rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimg)
-            self.label_video.setPixmap(pixmap)
-
-            # Update emotion label
-            self.label_emotion.setText(f"Emotion: {current_emotion}")
-
-    # Update Spotify track info
-    def update_track_label(self):
-        update_track_info()
-        self.label_track.setText(f"Track: {current_track}")
-
-    # ---------------------------
-    # Spotify Controls
-    def toggle_play_pause(self):
-        try:
-            current = spotify.sp.current_playback()
-            if current and current.get("is_playing"):
-                spotify.pause()
-            else:
-                spotify.sp.start_playback()
-        except Exception as e:
-            print("Play/Pause error:", e)
-
-    def previous_track(self):
-        try:
-            spotify.sp.previous_track()
-        except Exception as e:
-            print("Previous track error:", e)
-
-    def next_track_emotion(self):
-        """Next track button triggers emotion detection first."""
-        global current_emotion
-        print("Next button pressed → detecting emotion...")
-        emotion = detect_dominant_emotion()
-        if emotion:
-            print(f"Detected emotion: {emotion}")
-            current_emotion = emotion
-            spotify.play_for_emotion(emotion)
-        else:
-            print("No face/emotion detected → skip to next track")
-            try:
-                spotify.sp.next_track()
-            except Exception as e:
-                print("Next track error:", e)
-
-
-# ---------------------------
-# RUN GUI
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    gui = AuraInterface()
-    gui.show()
-    sys.exit(app.exec())
+# interface.py — Aura Emotion Engine GUI with Aura effect
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtWidgets import QApplication, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QWidget
+from PySide6.QtGui import QPixmap, QImage
+from PySide6.QtCore import QTimer, QThread, Signal
+import cv2
+import numpy as np
+
+from webcam_manager import WebcamManager
+from emotion_analysis import EmotionAnalyzer
+from spotify_player import SpotifyPlayer
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+CLIENT_ID = "ba3712c147094d3e8291abe866ceae2b"
+CLIENT_SECRET = "9f2c96ee53c6439da9b4b7491cd4c84d"
+REDIRECT_URI = "http://127.0.0.1:8888/callback"
+
+EMOTION_FRAMES = 5
+VOTE_FRAME_SPACING = 0.1  # seconds between sampled vote frames
+VOTE_TIMEOUT = 5.0  # give up on a vote if frames stop arriving
+
+# Emotion → histogram slot, in model output order
+EMOTION_INDEX = {e: i for i, e in enumerate(EmotionAnalyzer.EMOTION_LABELS)}
+AURA_ALPHA = 0.25  # aura transparency
+
+# Aura color per emotion (BGR)
+COLOR_MAP = {
+    "happy": (0, 255, 255),       # yellow/cyan-ish
+    "sad": (255, 0, 0),           # blue
+    "angry": (0, 0, 255),         # red
+    "surprise": (0, 255, 255),    # white/yellow
+    "neutral": (128, 128, 128),   # gray
+}
+DEFAULT_COLOR = (50, 50, 50)      # default dark gray
+
+# Color LUT in EMOTION_INDEX order, default color in the last slot
+AURA_LUT = np.array(
+    [COLOR_MAP.get(e, DEFAULT_COLOR) for e in EmotionAnalyzer.EMOTION_LABELS]
+    + [DEFAULT_COLOR], dtype=np.uint8)
+
+# ---------------------------
+# GLOBAL STATE
+# ---------------------------
+wm = WebcamManager()
+ea = EmotionAnalyzer()
+spotify = SpotifyPlayer(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
+
+current_emotion = "None"
+current_track = "None"
+
+# ---------------------------
+# EMOTION WORKER THREAD
+# ---------------------------
+
+
+class EmotionWorker(QThread):
+    """Runs DeepFace analysis off the GUI thread.
+
+    Frames get pushed in from the 30 FPS timer through a small bounded
+    queue (extras are simply dropped), and results come back through Qt
+    signals — so the event loop never blocks on inference."""
+
+    emotionDetected = Signal(str)   # fires on every successful analysis
+    emotionReady = Signal(str)      # fires when a majority vote finishes
+
+    def __init__(self, analyzer):
+        super().__init__()
+        self.analyzer = analyzer
+        self.frames = queue.Queue(maxsize=2)
+        self._vote_frames = []
+        self._last_vote_t = 0.0
+        self._voting = False
+        self._running = True
+        self._pool = ThreadPoolExecutor(max_workers=EMOTION_FRAMES)
+        self._hist = np.zeros(len(EMOTION_INDEX), dtype=np.int32)
+
+    def submit(self, frame):
+        """Offer a frame for analysis. Dropped if the worker is busy."""
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            pass
+
+    def request_vote(self):
+        """Start collecting EMOTION_FRAMES frames, then emit emotionReady."""
+        self._vote_frames = []
+        self._last_vote_t = 0.0
+        self._vote_deadline = time.monotonic() + VOTE_TIMEOUT
+        self._voting = True
+
+    def _vote_timed_out(self):
+        """Abort a stalled vote (webcam stopped delivering frames) so the
+        Next button keeps its skip-track fallback."""
+        if self._voting and time.monotonic() > self._vote_deadline:
+            self._voting = False
+            self._vote_frames = []
+            self.emotionReady.emit("")
+            return True
+        return False
+
+    def stop(self):
+        self._running = False
+        self.submit(None)
+        self._pool.shutdown(wait=False)
+
+    def run(self):
+        while self._running:
+            try:
+                frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                # No frames coming in — check for a stalled vote
+                self._vote_timed_out()
+                continue
+            if frame is None:
+                break
+
+            if self._voting:
+                if self._vote_timed_out():
+                    continue
+                # Sample distinct frames spaced by the monotonic clock,
+                # then analyze them all at once in parallel
+                now = time.monotonic()
+                if now - self._last_vote_t >= VOTE_FRAME_SPACING:
+                    self._vote_frames.append(frame)
+                    self._last_vote_t = now
+                if len(self._vote_frames) >= EMOTION_FRAMES:
+                    self._voting = False
+                    self._run_vote()
+                continue
+
+            data = self.analyzer.analyze(frame)
+            if data:
+                self.emotionDetected.emit(data["emotion"])
+
+    def _run_vote(self):
+        """Analyze the sampled frames in parallel and majority-vote.
+        TF releases the GIL during inference, so the threads overlap."""
+        results = self._pool.map(self.analyzer.analyze, self._vote_frames)
+        self._hist[:] = 0
+        for data in results:
+            if data:
+                self._hist[EMOTION_INDEX[data["emotion"]]] += 1
+        self._vote_frames = []
+        if self._hist.any():
+            winner = EmotionAnalyzer.EMOTION_LABELS[int(self._hist.argmax())]
+            self.emotionReady.emit(winner)
+        else:
+            self.emotionReady.emit("")
+
+# ---------------------------
+# GUI CLASS
+# ---------------------------
+
+
+class AuraInterface(QWidget):
+
+    playbackUpdated = Signal(str)  # track label text from the poller
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Aura Emotion Engine")
+        self.resize(700, 600)
+
+        # Widgets
+        self.label_video = QLabel(self)
+        self.label_emotion = QLabel("Emotion: None", self)
+        self.label_track = QLabel("Track: None", self)
+
+        self.btn_play_pause = QPushButton("Play / Pause", self)
+        self.btn_prev = QPushButton("Previous", self)
+        self.btn_next = QPushButton("Next (Emotion)", self)
+
+        # Layouts
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.btn_prev)
+        button_layout.addWidget(self.btn_play_pause)
+        button_layout.addWidget(self.btn_next)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.label_video)
+        layout.addWidget(self.label_emotion)
+        layout.addWidget(self.label_track)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        # Signals
+        self.btn_play_pause.clicked.connect(self.toggle_play_pause)
+        self.btn_prev.clicked.connect(self.previous_track)
+        self.btn_next.clicked.connect(self.next_track_emotion)
+
+        # Warm-boot the emotion model while Qt finishes starting up, so
+        # the first Next click doesn't pay the ~5s model load
+        threading.Thread(target=ea.warm_up, daemon=True).start()
+
+        # Emotion worker (keeps DeepFace off the GUI thread)
+        self.worker = EmotionWorker(ea)
+        self.worker.emotionDetected.connect(self.on_emotion_detected)
+        self.worker.emotionReady.connect(self.on_emotion_ready)
+        self.worker.start()
+
+        # Aura backgrounds with the alpha already baked in (color × α),
+        # indexed by EMOTION_INDEX — the per-frame blend then only has to
+        # scale the frame and add the constant
+        self._aura_bg = [
+            np.full((wm.height, wm.width, 3),
+                    (color.astype(np.float32) * AURA_ALPHA).astype(np.uint8),
+                    dtype=np.uint8)
+            for color in AURA_LUT
+        ]
+
+        # Small ring of persistent display buffers, each with a QImage
+        # bound to its memory — the blend writes in place (no per-frame
+        # allocation), and rotating buffers means we never scribble over
+        # the one Qt may still be painting
+        self._ring = [np.empty((wm.height, wm.width, 3), dtype=np.uint8)
+                      for _ in range(3)]
+        self._ring_qimgs = [QImage(buf.data, wm.width, wm.height,
+                                   wm.width * 3, QImage.Format_BGR888)
+                            for buf in self._ring]
+        self._ring_idx = 0
+
+        # Timers
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_frame)
+        self.timer.start(30)  # ~30 FPS
+
+        # Playback poller — keeps Spotify state warm off the GUI thread,
+        # so button handlers never wait on an HTTPS round trip
+        self._last_playback = None
+        self.playbackUpdated.connect(self.on_playback_updated)
+        threading.Thread(target=self._poll_playback, daemon=True).start()
+
+    # ---------------------------
+    # Webcam feed with Aura overlay
+    def update_frame(self):
+        ok, frame = wm.get_frame()
+        if ok:
+            # Feed the worker — the 30 FPS cadence provides frame spacing
+            self.worker.submit(frame)
+
+            # Blend the prescaled aura straight into the next ring buffer —
+            # the α factor is baked into the background, so beta is 1.0
+            self._ring_idx = (self._ring_idx + 1) % len(self._ring)
+            idx = EMOTION_INDEX.get(current_emotion, len(AURA_LUT) - 1)
+            cv2.addWeighted(frame, 1 - AURA_ALPHA, self._aura_bg[idx],
+                            1.0, 0, dst=self._ring[self._ring_idx])
+
+            # The QImage already wraps the buffer — just repaint
+            self.label_video.setPixmap(
+                QPixmap.fromImage(self._ring_qimgs[self._ring_idx]))
+
+            # Update emotion label
+            self.label_emotion.setText(f"Emotion: {current_emotion}")
+
+    # Worker results
+    def on_emotion_detected(self, emotion):
+        global current_emotion
+        current_emotion = emotion
+
+    def on_emotion_ready(self, emotion):
+        """Majority vote finished → start playback (or skip if no face)."""
+        global current_emotion
+        if emotion:
+            print(f"Detected emotion: {emotion}")
+            current_emotion = emotion
+            spotify.play_for_emotion(emotion)
+        else:
+            print("No face/emotion detected → skip to next track")
+            try:
+                spotify.sp.next_track()
+            except Exception as e:
+                print("Next track error:", e)
+
+    # Spotify playback polling (runs on a daemon thread)
+    def _poll_playback(self):
+        global current_track
+        while True:
+            try:
+                current = spotify.sp.current_playback()
+                self._last_playback = current
+                if current and current.get("item"):
+                    track_name = current["item"]["name"]
+                    artist_name = ", ".join([a["name"]
+                                            for a in current["item"]["artists"]])
+                    current_track = f"{track_name} - {artist_name}"
+                else:
+                    current_track = "No track playing"
+            except:
+                current_track = "Error getting track info"
+            self.playbackUpdated.emit(current_track)
+            time.sleep(5)  # Update every 5 sec
+
+    def on_playback_updated(self, track):
+        self.label_track.setText(f"Track: {track}")
+
+    # ---------------------------
+    # Spotify Controls
+    def toggle_play_pause(self):
+        try:
+            # Use the poller's cached state — no round trip on the click.
+            # Flip the cached bit right away so a second click inside the
+            # 5s poll window sees the toggled state
+            current = self._last_playback
+            if current and current.get("is_playing"):
+                spotify.pause()
+                current["is_playing"] = False
+            else:
+                spotify.sp.start_playback()
+                if current:
+                    current["is_playing"] = True
+        except Exception as e:
+            print("Play/Pause error:", e)
+
+    def previous_track(self):
+        try:
+            spotify.sp.previous_track()
+        except Exception as e:
+            print("Previous track error:", e)
+
+    def next_track_emotion(self):
+        """Next track button triggers emotion detection first."""
+        print("Next button pressed → detecting emotion...")
+        self.worker.request_vote()
+
+    def closeEvent(self, event):
+        self.worker.stop()
+        self.worker.wait()
+        super().closeEvent(event)
+
+
+# ---------------------------
+# RUN GUI
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    gui = AuraInterface()
+    gui.show()
+    sys.exit(app.exec())
@@ -1,52 +1,79 @@
-import cv2
-
-
-class WebcamManager:
-    def __init__(self, device_index: int = 0, width: int = 640, height: int = 480):
-        """
-        Initialize webcam.
-
-        Args:
-            device_index: Webcam index (usually 0)
-            width: Desired frame width
-            height: Desired frame height
-        """
-        self.device_index = device_index
-        self.width = width
-        self.height = height
-
-        self.cap = cv2.VideoCapture(device_index)
-        if not self.cap.isOpened():
-            raise RuntimeError(
-                f"❌ Could not open webcam (device index: {device_index})")
-
-        # Set camera resolution
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-
-    def get_frame(self):
-        """Returns (success, frame).  
-        success=False means no frame was captured."""
-        if not self.cap:
-            return False, None
-
-        success, frame = self.cap.read()
-        return success, frame
-
-    def read(self):
-        """Simple alias for get_frame()."""
-        return self.get_frame()
-
-    def is_opened(self) -> bool:
-        """Check if webcam is still open."""
-        return self.cap.isOpened() if self.cap else False
-
-    def release(self):
-        """Release webcam resource."""
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-
-    def __del__(self):
-        """Safety cleanup."""
-        self.release()
+import threading
+import time
+
+import cv2
+
+
+class WebcamManager:
+    def __init__(self, device_index: int = 0, width: int = 640, height: int = 480):
+        """
+        Initialize webcam.
+
+        Args:
+            device_index: Webcam index (usually 0)
+            width: Desired frame width
+            height: Desired frame height
+        """
+        self.device_index = device_index
+        self.width = width
+        self.height = height
+
+        self.cap = cv2.VideoCapture(device_index)
+        if not self.cap.isOpened():
+            raise RuntimeError(
+                f"❌ Could not open webcam (device index: {device_index})")
+
+        # Set camera resolution — the request is advisory, so read back
+        # what the driver actually delivers; buffers sized off width/height
+        # downstream must match the real frames
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or width
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or height
+
+        # Keep the driver queue short so retrieved frames are never stale
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        # Background grabber keeps pulling frames at the sensor rate, so
+        # consumers always retrieve the *newest* frame even if they stall
+        self._lock = threading.Lock()
+        self._running = True
+        self._grabber = threading.Thread(target=self._grab_loop, daemon=True)
+        self._grabber.start()
+
+    def _grab_loop(self):
+        """Cheap grab() at ~30 Hz to drain the driver buffer."""
+        while self._running:
+            with self._lock:
+                if self.cap:
+                    self.cap.grab()
+            time.sleep(1 / 30)
+
+    def get_frame(self):
+        """Returns (success, frame).
+        success=False means no frame was captured."""
+        with self._lock:
+            if not self.cap:
+                return False, None
+            # Decode only on demand — the grabber already fetched the frame
+            return self.cap.retrieve()
+
+    def read(self):
+        """Simple alias for get_frame()."""
+        return self.get_frame()
+
+    def is_opened(self) -> bool:
+        """Check if webcam is still open."""
+        return self.cap.isOpened() if self.cap else False
+
+    def release(self):
+        """Release webcam resource."""
+        self._running = False
+        with self._lock:
+            if self.cap:
+                self.cap.release()
+                self.cap = None
+
+    def __del__(self):
+        """Safety cleanup."""
+        self.release()